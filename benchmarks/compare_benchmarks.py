@@ -0,0 +1,65 @@
+"""Compare two result files of run_benchmarks.py
+
+Prints a table of all measurements present in both files and exits with code 1
+if any of them got slower than the given threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        (result["tool"], result["command"], result["state"]): result
+        for result in data["results"]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline", help="results of the reference run")
+    parser.add_argument("candidate", help="results of the run to check")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="ratio candidate / baseline of the minimal times counted as regression",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+
+    print(
+        f"{'tool':10} {'command':12} {'state':5} {'baseline':>10} {'candidate':>10}"
+        f" {'ratio':>7} {'processes':>13}"
+    )
+    regressions = []
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        ratio = new["seconds_min"] / old["seconds_min"]
+        marker = ""
+        if ratio > args.threshold:
+            regressions.append(key)
+            marker = "  <-- slower"
+        processes = f"{old['processes']} -> {new['processes']}"
+        print(
+            f"{key[0]:10} {key[1]:12} {key[2]:5} {old['seconds_min']:9.3f}s"
+            f" {new['seconds_min']:9.3f}s {ratio:7.2f} {processes:>13}{marker}"
+        )
+
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"only in one of the files: {' '.join(key)}")
+
+    if regressions:
+        print(
+            f"\n{len(regressions)} measurement(s) slower than {args.threshold}x baseline."
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
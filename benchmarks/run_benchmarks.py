@@ -0,0 +1,443 @@
+"""Benchmark pipt subcommands against a local package index
+
+Serves synthetic packages plus the base tools (pip, uv, pip-tools, ...) from a
+localhost PEP 503 index (or a find-links directory) and times cold and warm
+invocations of pipt subcommands for uv and pip-tools. Results are written as
+JSON, use compare_benchmarks.py to compare two runs.
+
+cold: empty HOME, i.e. no venv, no ~/.pipt caches and no pip / uv caches.
+warm: the same invocation repeated directly afterwards.
+
+The base tools are downloaded from the public index once into a wheelhouse
+(see --wheelhouse). After that benchmarks run offline.
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import datetime
+import functools
+import hashlib
+import http.server
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PIPT = os.path.join(BENCHMARKS_DIR, os.pardir, "pipt")
+DEFAULT_WHEELHOUSE = os.path.join(
+    os.path.expanduser("~"), ".cache", "pipt-benchmarks", "wheelhouse"
+)
+
+BASE_TOOLS = ["packaging", "pip>=24", "pip-tools", "uv", "wheel"]
+COMMANDS = ["shell", "run", "sync", "lock", "add", "download", "sync-system"]
+TOOLS = {"uv": "true", "pip-tools": "false"}
+
+# synthetic packages: a binary tree of runtime dependencies below "synth-0"
+# plus a few dev tools and a package to add
+NUM_RUNTIME_PACKAGES = 31
+NUM_DEV_PACKAGES = 5
+
+
+def normalize(name: str) -> str:
+    """PEP 503 normalized project name"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def build_wheel(
+    wheelhouse: str, name: str, version: str, requires: Optional[List[str]] = None
+):
+    """Build a minimal pure Python wheel"""
+    module = name.replace("-", "_")
+    dist_info = f"{module}-{version}.dist-info"
+    metadata = f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+    for requirement in requires or []:
+        metadata += f"Requires-Dist: {requirement}\n"
+    files = {
+        f"{module}.py": f"VERSION = {version!r}\n",
+        f"{dist_info}/METADATA": metadata,
+        f"{dist_info}/WHEEL": (
+            "Wheel-Version: 1.0\nGenerator: pipt-benchmarks\n"
+            "Root-Is-Purelib: true\nTag: py3-none-any\n"
+        ),
+    }
+    files[f"{dist_info}/RECORD"] = (
+        "".join(f"{path},,\n" for path in files) + f"{dist_info}/RECORD,,\n"
+    )
+
+    wheel_path = os.path.join(wheelhouse, f"{module}-{version}-py3-none-any.whl")
+    with zipfile.ZipFile(wheel_path, "w") as wheel:
+        for path, content in files.items():
+            wheel.writestr(path, content)
+
+
+def build_synthetic_packages(wheelhouse: str):
+    for i in range(NUM_RUNTIME_PACKAGES):
+        children = [2 * i + 1, 2 * i + 2]
+        requires = [
+            f"synth-{child}>=1.0" for child in children if child < NUM_RUNTIME_PACKAGES
+        ]
+        build_wheel(wheelhouse, f"synth-{i}", "1.0", requires)
+    for i in range(NUM_DEV_PACKAGES):
+        build_wheel(
+            wheelhouse,
+            f"synthdev-{i}",
+            "1.0",
+            [f"synth-{NUM_RUNTIME_PACKAGES - 1 - i}"],
+        )
+    build_wheel(wheelhouse, "synthextra", "1.0", ["synth-1"])
+
+
+def prepare_wheelhouse(wheelhouse: str, python: str):
+    """Download the base tools once, then (re)build the synthetic packages"""
+    os.makedirs(wheelhouse, exist_ok=True)
+    stamp = os.path.join(wheelhouse, ".base-tools-" + platform.python_version())
+    if not os.path.exists(stamp):
+        print(f"Downloading base tools into {wheelhouse} (only once)", file=sys.stderr)
+        subprocess.run(
+            [
+                python,
+                "-m",
+                "pip",
+                "download",
+                "--only-binary",
+                ":all:",
+                "-d",
+                wheelhouse,
+            ]
+            + BASE_TOOLS,
+            check=True,
+        )
+        open(stamp, "w").close()
+    build_synthetic_packages(wheelhouse)
+
+
+def build_simple_index(wheelhouse: str, index_root: str):
+    """PEP 503 simple index of all wheels in the wheelhouse"""
+    files_by_project: Dict[str, List[str]] = {}
+    for file_name in sorted(os.listdir(wheelhouse)):
+        if file_name.endswith(".whl"):
+            project = normalize(file_name.split("-")[0])
+            files_by_project.setdefault(project, []).append(file_name)
+
+    os.symlink(os.path.abspath(wheelhouse), os.path.join(index_root, "files"))
+    simple = os.path.join(index_root, "simple")
+    os.makedirs(simple)
+    with open(os.path.join(simple, "index.html"), "w") as f:
+        f.write("<!DOCTYPE html><html><body>\n")
+        for project in files_by_project:
+            f.write(f'<a href="{project}/">{project}</a>\n')
+        f.write("</body></html>\n")
+
+    for project, file_names in files_by_project.items():
+        os.makedirs(os.path.join(simple, project))
+        with open(os.path.join(simple, project, "index.html"), "w") as f:
+            f.write("<!DOCTYPE html><html><body>\n")
+            for file_name in file_names:
+                with open(os.path.join(wheelhouse, file_name), "rb") as wheel:
+                    sha256 = hashlib.sha256(wheel.read()).hexdigest()
+                f.write(
+                    f'<a href="../../files/{file_name}#sha256={sha256}">{file_name}</a>\n'
+                )
+            f.write("</body></html>\n")
+
+
+def start_index_server(index_root: str) -> http.server.ThreadingHTTPServer:
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(QuietHandler, directory=index_root)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def index_environment(wheelhouse: str, index_url: Optional[str]) -> Dict[str, str]:
+    """Environment variables pointing pip, pip-tools and uv to the local index"""
+    if index_url is not None:
+        return {
+            "PIP_INDEX_URL": index_url,
+            "UV_INDEX_URL": index_url,
+            "UV_DEFAULT_INDEX": index_url,
+        }
+    return {
+        "PIP_NO_INDEX": "1",
+        "PIP_FIND_LINKS": wheelhouse,
+        "UV_NO_INDEX": "1",
+        "UV_FIND_LINKS": wheelhouse,
+    }
+
+
+def run_pipt(command: List[str], env: Dict[str, str], cwd: str, stdin: str = ""):
+    result = subprocess.run(
+        command,
+        env=env,
+        cwd=cwd,
+        input=stdin.encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"{' '.join(command)} failed in {cwd}:\n{result.stdout.decode()}"
+        )
+
+
+def timed(command: List[str], env: Dict[str, str], cwd: str, stdin: str = "") -> float:
+    """Run a pipt command, return its wall time"""
+    start = time.perf_counter()
+    run_pipt(command, env, cwd, stdin)
+    return time.perf_counter() - start
+
+
+FORK_PATTERN = re.compile(r"^(<\.\.\. )?(clone3?|fork|vfork)\b.*= [0-9]+$")
+
+
+def count_processes(trace_dir: str) -> int:
+    """Number of processes created according to the files of `strace -ff`
+
+    Threads (clone with CLONE_THREAD, e.g. of uv) are not counted.
+    """
+    count = 0
+    for file_name in os.listdir(trace_dir):
+        with open(os.path.join(trace_dir, file_name)) as f:
+            for line in f:
+                line = line.rstrip()
+                if FORK_PATTERN.match(line) and "CLONE_THREAD" not in line:
+                    count += 1
+    return count
+
+
+def counted(
+    command: List[str], env: Dict[str, str], cwd: str, stdin: str = ""
+) -> Optional[int]:
+    """Run a pipt command under strace, return the number of processes it created
+
+    All forks of the invocation and its descendants are counted, i.e. helpers
+    like stat, sha256sum or awk and subshells as well as pip, uv and python. None
+    if strace is not available. Runs separately from the timed runs, since
+    strace slows down process creation considerably.
+    """
+    strace = shutil.which("strace")
+    if strace is None:
+        return None
+    with tempfile.TemporaryDirectory() as trace_dir:
+        run_pipt(
+            [strace, "-ff", "-qq", "-e", "trace=fork,vfork,clone,clone3"]
+            + ["-e", "signal=none", "-o", os.path.join(trace_dir, "trace")]
+            + command,
+            env,
+            cwd,
+            stdin,
+        )
+        return count_processes(trace_dir)
+
+
+class Benchmark:
+    def __init__(
+        self, pipt: str, python: str, tool: str, base_env: Dict[str, str], work_dir: str
+    ):
+        self.pipt = pipt
+        self.python = python
+        self.tool = tool
+        self.base_env = base_env
+        self.work_dir = work_dir
+        self.counter = 0
+        self.template = self.new_dir("template")
+        self.prepare_template()
+
+    def new_dir(self, name: str) -> str:
+        self.counter += 1
+        path = os.path.join(self.work_dir, f"{self.tool}-{self.counter}-{name}")
+        os.makedirs(path)
+        return path
+
+    def env(self, home: str, **extra) -> Dict[str, str]:
+        return {
+            **self.base_env,
+            "HOME": home,
+            "PIPT_PYTHON_INTERPRETER": self.python,
+            "PIPT_USE_UV": TOOLS[self.tool],
+            **extra,
+        }
+
+    def prepare_template(self):
+        """A locked project all benchmarks start from"""
+        with open(os.path.join(self.template, "requirements.in"), "w") as f:
+            f.write("-c requirements-base.txt\nsynth-0\n")
+        with open(os.path.join(self.template, "requirements-dev.in"), "w") as f:
+            f.write("-c requirements.txt\n-c requirements-base.txt\n")
+            for i in range(NUM_DEV_PACKAGES):
+                f.write(f"synthdev-{i}\n")
+        home = self.new_dir("home")
+        run_pipt([self.pipt, "lock"], self.env(home), self.template)
+
+    def fresh_project(self):
+        """Copy of the locked template project with an empty HOME"""
+        project = self.new_dir("project")
+        for file_name in os.listdir(self.template):
+            shutil.copy(os.path.join(self.template, file_name), project)
+        return project, self.new_dir("home")
+
+    def invocation(self, command: str, project: str, home: str):
+        """Arguments, environment and stdin of one benchmarked invocation"""
+        env = self.env(home)
+        stdin = ""
+        if command == "shell":
+            args, stdin = ["shell"], "exit\n"
+        elif command == "run":
+            args = ["run", "--", "true"]
+        elif command == "sync":
+            args = ["sync"]
+        elif command == "lock":
+            args = ["lock"]
+        elif command == "add":
+            args = ["add", "synthextra"]
+        elif command == "download":
+            args = ["download", os.path.join(project, "downloaded")]
+        elif command == "sync-system":
+            # a plain venv plays the role of the system interpreter
+            system = os.path.join(project, "system")
+            if not os.path.exists(system):
+                subprocess.run([self.python, "-m", "venv", system], check=True)
+            env["PIPT_PYTHON_INTERPRETER"] = os.path.join(system, "bin", "python")
+            args = ["sync-system"]
+        else:
+            raise ValueError(f"Unknown command {command}")
+        return [self.pipt] + args, env, stdin
+
+    def run(self, command: str, repeat: int) -> List[dict]:
+        measurements = {"cold": [], "warm": []}
+        for _ in range(repeat):
+            project, home = self.fresh_project()
+            args, env, stdin = self.invocation(command, project, home)
+            measurements["cold"].append(timed(args, env, project, stdin))
+            measurements["warm"].append(timed(args, env, project, stdin))
+
+        # the same invocations once more, under strace
+        project, home = self.fresh_project()
+        args, env, stdin = self.invocation(command, project, home)
+        process_counts = {
+            "cold": counted(args, env, project, stdin),
+            "warm": counted(args, env, project, stdin),
+        }
+
+        results = []
+        for state, seconds in measurements.items():
+            results.append(
+                {
+                    "tool": self.tool,
+                    "command": command,
+                    "state": state,
+                    "seconds_min": min(seconds),
+                    "seconds_median": statistics.median(seconds),
+                    "processes": process_counts[state],
+                    "repeat": repeat,
+                }
+            )
+            print(
+                f"{self.tool:10} {command:12} {state:5} "
+                f"{min(seconds):8.3f}s  {results[-1]['processes']} processes",
+                file=sys.stderr,
+            )
+        return results
+
+
+def pipt_version(pipt: str) -> str:
+    # read from the script: `pipt info` would create pipt files in the cwd
+    with open(pipt) as f:
+        for line in f:
+            match = re.match(r'^(declare -r )?PIPT_VERSION="?([^"\s]+)', line)
+            if match:
+                return match.group(2)
+    return "unknown"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pipt", default=DEFAULT_PIPT, help="pipt script to benchmark")
+    parser.add_argument(
+        "--python",
+        default=shutil.which("python3"),
+        help="Python interpreter for the projects",
+    )
+    parser.add_argument("--wheelhouse", default=DEFAULT_WHEELHOUSE)
+    parser.add_argument(
+        "--find-links",
+        action="store_true",
+        help="use the wheelhouse as find-links directory instead of a localhost index",
+    )
+    parser.add_argument("--commands", default=",".join(COMMANDS))
+    parser.add_argument("--tools", default=",".join(TOOLS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", "-o", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    pipt = os.path.abspath(args.pipt)
+    commands = args.commands.split(",")
+    tools = args.tools.split(",")
+    for name, selected, available in (
+        ("command", commands, COMMANDS),
+        ("tool", tools, TOOLS),
+    ):
+        unknown = set(selected) - set(available)
+        if unknown:
+            parser.error(f"unknown {name}(s): {', '.join(sorted(unknown))}")
+
+    prepare_wheelhouse(args.wheelhouse, args.python)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pipt-benchmarks-") as work_dir:
+        server = None
+        index_url = None
+        if not args.find_links:
+            index_root = os.path.join(work_dir, "index")
+            os.makedirs(index_root)
+            build_simple_index(args.wheelhouse, index_root)
+            server = start_index_server(index_root)
+            index_url = f"http://127.0.0.1:{server.server_address[1]}/simple/"
+
+        base_env = {
+            "PATH": os.environ.get("PATH", os.defpath),
+            "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+            **index_environment(args.wheelhouse, index_url),
+        }
+        try:
+            for tool in tools:
+                benchmark = Benchmark(pipt, args.python, tool, base_env, work_dir)
+                for command in commands:
+                    results += benchmark.run(command, args.repeat)
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    output = {
+        "meta": {
+            "pipt_version": pipt_version(pipt),
+            "pipt": pipt,
+            "python": subprocess.run([args.python, "--version"], capture_output=True)
+            .stdout.decode()
+            .strip(),
+            "platform": platform.platform(),
+            "index": "find-links" if args.find_links else "localhost",
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
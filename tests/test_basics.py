@@ -1,6 +1,13 @@
+import glob
+import hashlib
+import json
+import shutil
 import subprocess
+import sysconfig
+import time
 import os
 import pytest
+import zipfile
 
 from . import get_file_content
 
@@ -71,6 +78,9 @@ def check_created_files(path, check_req_txt_empty: bool = True, uv=True):
             "DEPENDENCY_SPECIFICATIONS_ABORT_HASH=",
             "DEPENDENCY_SPECIFICATIONS_FULL_HASH=",
             "PYTHON_ENVIRONMENT_BASE_HASH=",
+            "BASE_TIER_COMPILE_HASH=",
+            "RUNTIME_TIER_COMPILE_HASH=",
+            "DEV_TIER_COMPILE_HASH=",
         )
     )
 
@@ -290,9 +300,12 @@ def check_pipt_shell_and_adding_requests_as_dev_dep(
         env=env,  # control environment variables
         cwd=tmp_path,
         input="exit".encode(),  # command to run in the activated shell!
+        capture_output=True,
     )
 
     assert result.returncode == 0
+    # base dependencies locked while creating the venv are not compiled again
+    assert "Inputs of base dependencies unchanged" in result.stdout.decode()
 
     check_created_files(tmp_path, uv=use_uv)
 
@@ -301,10 +314,17 @@ def check_pipt_shell_and_adding_requests_as_dev_dep(
         [pipt_abs_path, "add", "requests", "--dev"],
         env=env,  # do not pass environment variables
         cwd=tmp_path,
+        capture_output=True,
     )
 
     assert result.returncode == 0
 
+    # only the dev dependencies had to be compiled again
+    result_stdout = result.stdout.decode()
+    assert "Inputs of base dependencies unchanged" in result_stdout
+    assert "Inputs of runtime dependencies unchanged" in result_stdout
+    assert "Compiling dev dependencies" in result_stdout
+
     check_created_files(tmp_path, check_req_txt_empty=False, uv=use_uv)
 
     req_in_content = get_file_content(tmp_path / "requirements.in")
@@ -609,3 +629,1048 @@ def test_sync_system_and_offline_install(tmp_path, use_uv, python_interpreter):
         cwd=tmp_path,
     )
     assert result.returncode == 0
+
+
+def test_interpreter_metadata_cache(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--python"],
+        env=env,  # control environment variables
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert result.stdout.decode().splitlines()[0] == python_interpreter
+
+    cache_file = (
+        new_home
+        / ".pipt"
+        / "interpreters"
+        / (python_interpreter.replace("/", "_") + ".env")
+    )
+    assert os.path.isfile(cache_file)
+
+    cache_content = get_file_content(cache_file)
+    assert f"interpreter_fingerprint={python_interpreter} " in cache_content
+    assert "minor_version=3." in cache_content
+    assert "in_venv=false" in cache_content
+
+    # the minor version fixed in pipt_locks.env comes from the cached probe
+    minor_version = [
+        line.removeprefix("minor_version=")
+        for line in cache_content.splitlines()
+        if line.startswith("minor_version=")
+    ][0]
+    assert f"PY_VERSION={minor_version}" in get_file_content(
+        tmp_path / "pipt_locks.env"
+    )
+
+    # a stale cache entry (fingerprint mismatch) is probed again
+    with open(cache_file, "w") as f:
+        f.write("interpreter_fingerprint=outdated\nminor_version=2.7\n")
+
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--python"],
+        env=env,  # control environment variables
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert "minor_version=2.7" not in get_file_content(cache_file)
+
+    # a changed probe invalidates the cache, even if its length is the same
+    pipt_content = get_file_content(pipt_abs_path)
+    probe_imports = "import sys\nimport sysconfig\n"
+    assert pipt_content.count(probe_imports) == 1
+    changed_pipt = tmp_path / "changed_pipt"
+    with open(changed_pipt, "w") as f:
+        f.write(pipt_content.replace(probe_imports, "import sysconfig\nimport sys\n"))
+    os.chmod(changed_pipt, 0o755)
+    fingerprint_line = get_file_content(cache_file).splitlines()[0]
+    result = subprocess.run(
+        [str(changed_pipt), "info", "--python"],
+        env=env,  # control environment variables
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert get_file_content(cache_file).splitlines()[0] != fingerprint_line
+
+
+@pytest.mark.parametrize("use_uv", [True, False], ids=["using uv", "using pip-tools"])
+def test_base_venv_template_cache(tmp_path, use_uv, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    first_project = tmp_path / "first_project"
+    os.makedirs(first_project)
+    second_project = tmp_path / "second_project"
+    os.makedirs(second_project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+        "PIPT_USE_UV": "true" if use_uv else "false",
+    }
+
+    result = subprocess.run([pipt_abs_path, "venv"], env=env, cwd=first_project)
+    assert result.returncode == 0
+
+    templates = os.listdir(new_home / ".pipt" / "base_venvs")
+    assert len(templates) == 1
+
+    # a second project with the same base requirements clones the template
+    for file_name in (
+        "requirements-base.in",
+        "requirements-base.txt",
+        "pipt_locks.env",
+    ):
+        with open(second_project / file_name, "w") as f:
+            f.write(get_file_content(first_project / file_name))
+
+    result = subprocess.run(
+        [pipt_abs_path, "venv"], env=env, cwd=second_project, capture_output=True
+    )
+    assert result.returncode == 0
+    result_stdout = result.stdout.decode()
+    assert "Cloning base venv template" in result_stdout
+    assert "Creating base venv template" not in result_stdout
+    assert os.listdir(new_home / ".pipt" / "base_venvs") == templates
+
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--venv"],
+        env=env,
+        cwd=second_project,
+        capture_output=True,
+    )
+    # the venv path is a symlink to the live venv generation
+    path_to_venv = os.path.realpath(result.stdout.decode().splitlines()[0])
+
+    # the clone refers to its own path, not to the template
+    assert path_to_venv in get_file_content(os.path.join(path_to_venv, "bin/activate"))
+    assert templates[0] not in get_file_content(
+        os.path.join(path_to_venv, "pyvenv.cfg")
+    )
+
+    result = subprocess.run(
+        [os.path.join(path_to_venv, "bin/pip"), "--version"], capture_output=True
+    )
+    assert result.returncode == 0
+    assert path_to_venv in result.stdout.decode()
+
+    # the clone shares no files with the template, which other projects use
+    pip_init = "lib/*/site-packages/pip/__init__.py"
+    (template_pip,) = glob.glob(
+        str(new_home / ".pipt" / "base_venvs" / templates[0] / pip_init)
+    )
+    (clone_pip,) = glob.glob(os.path.join(path_to_venv, pip_init))
+    assert not os.path.samefile(template_pip, clone_pip)
+
+
+@pytest.mark.parametrize("use_uv", [True, False], ids=["using uv", "using pip-tools"])
+def test_wheel_store(tmp_path, use_uv, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+        "PIPT_USE_UV": "true" if use_uv else "false",
+    }
+
+    result = subprocess.run([pipt_abs_path, "lock"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    result = subprocess.run(
+        [pipt_abs_path, "download", str(tmp_path / "first")], env=env, cwd=project
+    )
+    assert result.returncode == 0
+
+    store_path = new_home / ".pipt" / "wheels"
+    stored_files = sorted(os.listdir(store_path / "flat"))
+    assert any("pip-" in file_name for file_name in stored_files)
+    assert sorted(os.listdir(tmp_path / "first")) == stored_files
+
+    # everything is taken from the store now
+    result = subprocess.run(
+        [pipt_abs_path, "download", str(tmp_path / "second")],
+        env=env,
+        cwd=project,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert (
+        f"Found {len(stored_files)} locked artifacts in wheel store"
+        in result.stdout.decode()
+    )
+    assert "Downloading 0." in result.stdout.decode()
+    for file_name in stored_files:
+        assert os.path.samefile(
+            tmp_path / "second" / file_name, store_path / "flat" / file_name
+        )
+
+    # offline syncing directly from the store
+    result = subprocess.run([pipt_abs_path, "rmvenv"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    offline_env = {
+        **env,
+        "PIPT_OFFLINE_SYNC_FROM_WHEEL_STORE": "true",
+        "PIPT_BASE_VENV_TEMPLATE_CACHE": "false",
+    }
+    result = subprocess.run([pipt_abs_path, "sync"], env=offline_env, cwd=project)
+    assert result.returncode == 0
+
+
+def build_wheel(wheelhouse, name, version, content="pass\n", tag="py3-none-any"):
+    # minimal pure Python wheel, enough for pip download. Returns its sha256.
+    dist_info = f"{name}-{version}.dist-info"
+    files = {
+        f"{name}.py": content,
+        f"{dist_info}/METADATA": f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: {tag}\n",
+    }
+    files[f"{dist_info}/RECORD"] = (
+        "".join(f"{path},,\n" for path in files) + f"{dist_info}/RECORD,,\n"
+    )
+
+    wheel_path = wheelhouse / f"{name}-{version}-{tag}.whl"
+    with zipfile.ZipFile(wheel_path, "w") as wheel:
+        for path, file_content in files.items():
+            wheel.writestr(path, file_content)
+
+    with open(wheel_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_download_from_local_index(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+    wheelhouse = tmp_path / "wheelhouse"
+    os.makedirs(wheelhouse)
+
+    base_hash = build_wheel(wheelhouse, "fakebase", "1.0")
+    runtime_hash = build_wheel(wheelhouse, "fakeruntime", "1.0")
+    dev_hash = build_wheel(wheelhouse, "fakedev", "2.0")
+
+    lock_files = {
+        "requirements-base.txt": f"fakebase==1.0 \\\n    --hash=sha256:{base_hash}\n",
+        "requirements.txt": (
+            f"fakeruntime==1.0 \\\n    --hash=sha256:{'0' * 64} \\\n"
+            f"    --hash=sha256:{runtime_hash}\n    # via -r requirements.in\n"
+        ),
+        "requirements-dev.txt": (
+            f"fakeruntime==1.0 \\\n    --hash=sha256:{'0' * 64} \\\n"
+            f"    --hash=sha256:{runtime_hash}\n"
+            f'fakedev==2.0 ; python_version < "3" \\\n    --hash=sha256:{dev_hash}\n'
+        ),
+    }
+    for file_name, content in lock_files.items():
+        with open(project / file_name, "w") as f:
+            f.write(content)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+        "PIPT_PIP_DOWNLOAD_ARG_STRING": f"--no-index --find-links {wheelhouse}",
+        "PIPT_DOWNLOAD_JOBS": "2",
+    }
+
+    def download(target, **extra_env):
+        return subprocess.run(
+            [pipt_abs_path, "download", "--no-venv", str(target)],
+            env={**env, **extra_env},
+            cwd=project,
+            capture_output=True,
+        )
+
+    result = download(tmp_path / "first")
+    assert result.returncode == 0, result.stderr.decode()
+    assert "Found 0 locked artifacts" in result.stdout.decode()
+    assert "Downloading 3." in result.stdout.decode()
+    # the dev requirement is excluded by its environment marker
+    assert sorted(os.listdir(tmp_path / "first")) == [
+        "fakebase-1.0-py3-none-any.whl",
+        "fakeruntime-1.0-py3-none-any.whl",
+    ]
+
+    # everything (including the marker decision) is known to the wheel store now
+    result = download(tmp_path / "second")
+    assert result.returncode == 0
+    assert "Found 2 locked artifacts" in result.stdout.decode()
+    assert "Downloading 0." in result.stdout.decode()
+
+    # selections stay deduplicated when artifacts are verified again from a target
+    # directory, here since the store lost them
+    shutil.rmtree(new_home / ".pipt" / "wheels" / "sha256")
+    result = download(tmp_path / "first")
+    assert result.returncode == 0
+    assert "Found 2 locked artifacts" in result.stdout.decode()
+    (selections_file,) = (new_home / ".pipt" / "wheels" / "selections").iterdir()
+    selected = [
+        line.rsplit("\t", 1)[0]
+        for line in get_file_content(selections_file).splitlines()
+    ]
+    assert len(selected) == len(set(selected)) == 3
+
+    # without store: files with matching hash are kept, others downloaded again
+    target = tmp_path / "third"
+    result = download(target, PIPT_WHEEL_STORE="false")
+    assert result.returncode == 0
+    assert "Downloading 3." in result.stdout.decode()
+
+    with open(target / "fakeruntime-1.0-py3-none-any.whl", "wb") as f:
+        f.write(b"truncated download")
+
+    result = download(target, PIPT_WHEEL_STORE="false")
+    assert result.returncode == 0
+    assert "Found 1 locked artifacts in target directory" in result.stdout.decode()
+    assert "Downloading 2." in result.stdout.decode()
+    with open(target / "fakeruntime-1.0-py3-none-any.whl", "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == runtime_hash
+
+    # a platform wheel published after locking is not chosen
+    platform_tag = "py3-none-" + sysconfig.get_platform().replace("-", "_").replace(
+        ".", "_"
+    )
+    build_wheel(wheelhouse, "fakeruntime", "1.0", tag=platform_tag)
+    # pip filters candidates by hash if the index publishes them (PEP 503)
+    simple_index = tmp_path / "simple"
+    for wheel in os.listdir(wheelhouse):
+        project_dir = simple_index / wheel.split("-")[0]
+        os.makedirs(project_dir, exist_ok=True)
+        with open(wheelhouse / wheel, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        with open(project_dir / "index.html", "a") as f:
+            f.write(
+                f'<a href="{(wheelhouse / wheel).as_uri()}#sha256={sha256}">{wheel}</a>\n'
+            )
+    result = download(
+        tmp_path / "fourth",
+        PIPT_WHEEL_STORE="false",
+        PIPT_PIP_DOWNLOAD_ARG_STRING=f"--index-url {simple_index.as_uri()}",
+    )
+    assert result.returncode == 0, result.stderr.decode()
+    assert "fakeruntime-1.0-py3-none-any.whl" in os.listdir(tmp_path / "fourth")
+    os.remove(wheelhouse / f"fakeruntime-1.0-{platform_tag}.whl")
+
+    # files downloaded before pip failed are verified and kept for resuming
+    failing_python = tmp_path / "failing_python"
+    with open(failing_python, "w") as f:
+        f.write(
+            f'#!/bin/bash\n"{python_interpreter}" "$@" || exit\n'
+            '[[ "$1 $2 $3" != "-m pip download" ]]\n'
+        )
+    os.chmod(failing_python, 0o755)
+    target = tmp_path / "partial"
+    result = download(
+        target,
+        PIPT_WHEEL_STORE="false",
+        PIPT_DOWNLOAD_JOBS="1",
+        PIPT_PYTHON_INTERPRETER=str(failing_python),
+    )
+    assert result.returncode != 0
+    assert "Verified artifacts are kept" in result.stderr.decode()
+    assert sorted(os.listdir(target)) == [
+        "fakebase-1.0-py3-none-any.whl",
+        "fakeruntime-1.0-py3-none-any.whl",
+    ]
+
+    # artifacts not matching the locked hashes are rejected
+    build_wheel(wheelhouse, "fakeruntime", "1.0", content="tampered = True\n")
+    result = download(tmp_path / "fifth", PIPT_WHEEL_STORE="false")
+    assert result.returncode != 0
+    assert "DO NOT MATCH THE HASHES" in result.stderr.decode()
+
+
+def nar_serialization(path):
+    # straightforward reference implementation of the NAR format used by nix
+    def string(data):
+        if isinstance(data, str):
+            data = data.encode()
+        padding = b"\0" * ((8 - len(data) % 8) % 8)
+        return len(data).to_bytes(8, "little") + data + padding
+
+    def node(path):
+        if os.path.islink(path):
+            return b"".join(
+                map(string, ["(", "type", "symlink", "target", os.readlink(path), ")"])
+            )
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                contents = f.read()
+            executable = ["executable", ""] if os.access(path, os.X_OK) else []
+            parts = ["(", "type", "regular", *executable, "contents", contents, ")"]
+            return b"".join(map(string, parts))
+        result = b"".join(map(string, ["(", "type", "directory"]))
+        for name in sorted(os.listdir(path)):
+            result += b"".join(map(string, ["entry", "(", "name", name, "node"]))
+            result += node(os.path.join(path, name)) + string(")")
+        return result + string(")")
+
+    return string("nix-archive-1") + node(path)
+
+
+def test_nix_hash(tmp_path):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    fixture = tmp_path / "fixture"
+    os.makedirs(fixture / "nested" / "deeper")
+    with open(fixture / "hello.txt", "w") as f:
+        f.write("hello\n")
+    os.chmod(fixture / "hello.txt", 0o644)
+    with open(fixture / "empty", "w") as f:
+        pass
+    os.chmod(fixture / "empty", 0o644)
+    with open(fixture / "nested" / "run.sh", "w") as f:
+        f.write("#!/bin/sh\necho 12345678\n")
+    os.chmod(fixture / "nested" / "run.sh", 0o755)
+    with open(fixture / "nested" / "deeper" / "data.bin", "wb") as f:
+        f.write(bytes(range(256)) * 5000)
+    os.symlink("hello.txt", fixture / "link")
+    os.makedirs(fixture / "empty_dir")
+
+    def nix_hash(path):
+        result = subprocess.run(
+            [pipt_abs_path, "nix-hash", str(path)],
+            env={"HOME": str(tmp_path)},
+            cwd=tmp_path,
+            capture_output=True,
+        )
+        assert result.returncode == 0, result.stderr.decode()
+        return result.stdout.decode().strip()
+
+    # pinned sha256 of the NAR serialization of the deterministic fixture
+    expected_hashes = {
+        fixture: "f3f5cf3ecee94fc0997da792d5dbf5e16c402c1396b95aad4a66f80e419065c1",
+        fixture / "hello.txt": (
+            "1c37d01af40be2e80691de3cc3df44377a699afbb17c68f080964b2fd071fc13"
+        ),
+    }
+    for path, expected_hash in expected_hashes.items():
+        assert nix_hash(path) == expected_hash
+        # secondary check against the reference implementation above
+        assert hashlib.sha256(nar_serialization(path)).hexdigest() == expected_hash
+
+    # the NAR of a regular file, spelled out byte by byte
+    assert nar_serialization(fixture / "hello.txt") == (
+        b"\x0d\0\0\0\0\0\0\0nix-archive-1\0\0\0"
+        b"\x01\0\0\0\0\0\0\0(\0\0\0\0\0\0\0"
+        b"\x04\0\0\0\0\0\0\0type\0\0\0\0"
+        b"\x07\0\0\0\0\0\0\0regular\0"
+        b"\x08\0\0\0\0\0\0\0contents"
+        b"\x06\0\0\0\0\0\0\0hello\n\0\0"
+        b"\x01\0\0\0\0\0\0\0)\0\0\0\0\0\0\0"
+    )
+
+    # no pipt files are created outside of projects
+    assert os.listdir(tmp_path) == ["fixture"]
+
+
+def test_add_and_remove_with_requirements_file(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    with open(tmp_path / "list.txt", "w") as f:
+        f.write("# several specs at once\nsix\n\nidna>=3 # for urls\n")
+
+    result = subprocess.run(
+        [pipt_abs_path, "add", "-r", str(tmp_path / "list.txt")],
+        env=env,
+        cwd=project,
+        capture_output=True,
+    )
+    assert result.returncode == 0, result.stderr.decode()
+
+    req_in_lines = get_file_content(project / "requirements.in").splitlines()
+    assert "six" in req_in_lines
+    assert "idna>=3 # for urls" in req_in_lines
+    req_txt_content = get_file_content(project / "requirements.txt")
+    assert "six==" in req_txt_content
+    assert "idna==" in req_txt_content
+
+    # the requirements editor is cached instead of written to /tmp on each call
+    helpers = os.listdir(new_home / ".pipt" / "helpers")
+    assert len(helpers) == 1
+    assert "pip._internal" not in get_file_content(
+        new_home / ".pipt" / "helpers" / helpers[0]
+    )
+
+    result = subprocess.run(
+        [pipt_abs_path, "add", "--dev", "six"],
+        env=env,
+        cwd=project,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+
+    # removes from runtime and dev dependencies in one run
+    result = subprocess.run(
+        [pipt_abs_path, "remove", "six", "idna"],
+        env=env,
+        cwd=project,
+        capture_output=True,
+    )
+    assert result.returncode == 0, result.stderr.decode()
+    for file_name in ("requirements.in", "requirements-dev.in"):
+        req_in_content = get_file_content(project / file_name)
+        assert "six" not in req_in_content
+        assert "idna" not in req_in_content
+    assert "six==" not in get_file_content(project / "requirements.txt")
+    assert os.listdir(new_home / ".pipt" / "helpers") == helpers
+
+    # without HOME the requirements editor is written to a temporary file,
+    # which is removed again after use
+    tmp_dir = tmp_path / "tmp"
+    os.makedirs(tmp_dir)
+    result = subprocess.run(
+        [pipt_abs_path, "add", "six"],
+        env={
+            "PATH": os.environ["PATH"],
+            "TMPDIR": str(tmp_dir),
+            "PIPT_PYTHON_INTERPRETER": python_interpreter,
+        },
+        cwd=project,
+        capture_output=True,
+    )
+    assert result.returncode == 0, result.stderr.decode()
+    assert "six" in get_file_content(project / "requirements.in").splitlines()
+    assert not any(name.startswith("pyreq") for name in os.listdir(tmp_dir))
+
+
+def test_trace(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+        "PIPT_TRACE": "trace.json",
+        "PIPT_TRACE_FORMAT": "chrome",
+    }
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=tmp_path)
+    assert result.returncode == 0
+
+    # the closing bracket is optional in the Chrome trace event format
+    events = json.loads(
+        get_file_content(tmp_path / "trace.json").rstrip().rstrip(",") + "]"
+    )
+    decisions = [e["name"] for e in events if e["cat"] == "decision"]
+    assert "venv recreated because venv does not exist" in decisions
+    assert "dev tier compiled: lock file missing or compile hash mismatch" in decisions
+    assert "syncing because locked deps hash changed" in decisions
+
+    subprocess_ends = [e for e in events if e["cat"] == "subprocess" and e["ph"] == "E"]
+    assert "uv" in {e["name"] for e in subprocess_ends}
+    assert all(e["args"]["exit_code"] == 0 for e in subprocess_ends)
+
+    # every span is closed
+    for phase in ("phase", "subprocess"):
+        spans = [e for e in events if e["cat"] == phase]
+        assert len([e for e in spans if e["ph"] == "B"]) == len(
+            [e for e in spans if e["ph"] == "E"]
+        )
+
+    # JSON lines, spans left by a failing command are closed with its exit code
+    env["PIPT_TRACE"] = str(tmp_path / "trace.jsonl")
+    env["PIPT_TRACE_FORMAT"] = "jsonl"
+    result = subprocess.run(
+        [pipt_abs_path, "run", "--", "python", "-c", "import sys; sys.exit(3)"],
+        env=env,
+        cwd=tmp_path,
+    )
+    assert result.returncode == 3
+
+    events = [
+        json.loads(line)
+        for line in get_file_content(tmp_path / "trace.jsonl").splitlines()
+    ]
+    assert "sync skipped: sync stamp match" in [e["name"] for e in events]
+    assert events[-2]["name"] == "python"
+    assert events[-2]["args"]["exit_code"] == 3
+    assert events[-1]["name"] == "run"
+    assert events[-1]["ph"] == "E"
+    assert events[-1]["args"]["exit_code"] == 3
+
+
+def reference_hash(*parts):
+    # the hash of _hash_multiple: whitespace-trimmed strings and file contents,
+    # each followed by a separator line
+    separator = "\nb703d2e29001d23a7a3b153619c4a3cf0d75c0e5bc44cfe8991371344cd3cd1d\n"
+    content = ""
+    for part in parts:
+        if isinstance(part, str):
+            content += part.strip()
+        elif os.path.isfile(part):
+            content += get_file_content(part).strip()
+        content += separator
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def test_hash_cache(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=tmp_path)
+    assert result.returncode == 0
+
+    # surrounding whitespace does not matter
+    with open(tmp_path / "requirements-dev.txt", "a") as f:
+        f.write("\n  \n\t\n")
+
+    locks_env = get_file_content(tmp_path / "pipt_locks.env")
+    py_version = locks_env.split("PY_VERSION=")[1].splitlines()[0]
+    base_hash = reference_hash(py_version, tmp_path / "requirements-base.txt")
+    abort_hash = reference_hash(
+        py_version,
+        "true",
+        *(tmp_path / f"requirements{tier}.txt" for tier in ("-base", "", "-dev")),
+    )
+    assert f"PYTHON_ENVIRONMENT_BASE_HASH={base_hash}" in locks_env
+    assert f"DEPENDENCY_SPECIFICATIONS_ABORT_HASH={abort_hash}" in locks_env
+
+    # lock files modified within the timestamp granularity are not cached
+    time.sleep(3)
+    for _ in range(2):
+        result = subprocess.run([pipt_abs_path, "lock"], env=env, cwd=tmp_path)
+        assert result.returncode == 0
+        assert get_file_content(tmp_path / "pipt_locks.env") == locks_env
+
+    cache_content = get_file_content(new_home / ".pipt" / "hashes.tsv")
+    assert f"{base_hash}\t" in cache_content
+    assert len(cache_content.splitlines()) == len(set(cache_content.splitlines()))
+
+
+def test_query(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=tmp_path)
+    assert result.returncode == 0
+
+    def query(*args):
+        return subprocess.run(
+            [pipt_abs_path, "query", *args],
+            env=env,
+            cwd=tmp_path,
+            capture_output=True,
+        )
+
+    result = query("PyTest")
+    assert result.returncode == 0
+    lines = result.stdout.decode().splitlines()
+    assert lines[0].startswith("pytest==")
+    assert lines[0].endswith(" [dev]")
+    assert "    via: -r ./requirements-dev.in" in lines
+    assert any(line.startswith("    --hash=sha256:") for line in lines)
+
+    result = query("--reverse", "pluggy")
+    assert result.returncode == 0
+    lines = result.stdout.decode().splitlines()
+    assert lines[0].startswith("pluggy==")
+    assert lines[1].startswith("    pytest==")
+    assert lines[2] == "        -r ./requirements-dev.in"
+
+    result = query("not-locked-anywhere")
+    assert result.returncode == 1
+
+    # the index is rebuilt if a lock file changes
+    (index_file,) = (new_home / ".pipt" / "lock_indexes").iterdir()
+    with open(tmp_path / "requirements-dev.txt", "a") as f:
+        f.write("six==1.16.0\n")
+    result = query("six")
+    assert result.returncode == 0
+    assert result.stdout.decode().startswith("six==1.16.0 [dev]")
+    assert "six\tdev\t1.16.0\t" in get_file_content(index_file)
+
+    # installed distributions compared with the locked versions
+    result = query("--check", "--prod")
+    assert result.returncode == 1
+    assert "six==1.16.0" not in result.stdout.decode()
+    assert " is installed but not locked" in result.stdout.decode()
+
+    result = query("--check")
+    assert result.returncode == 1
+    assert result.stdout.decode() == "six==1.16.0 is locked but not installed\n"
+
+
+def test_query_check_direct_references(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    local_package = tmp_path / "local_pkg"
+    os.makedirs(local_package / "local_pkg")
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    with open(local_package / "pyproject.toml", "w") as f:
+        f.write(
+            '[build-system]\nrequires = ["setuptools"]\n'
+            'build-backend = "setuptools.build_meta"\n\n'
+            '[project]\nname = "local-pkg"\nversion = "0.1.0"\n'
+        )
+    with open(local_package / "local_pkg" / "__init__.py", "w") as f:
+        f.write("")
+    with open(tmp_path / "requirements.in", "w") as f:
+        f.write(
+            "six @ https://files.pythonhosted.org/packages/d9/5a/"
+            "e7c31adbe875f2abbb91bd84cf2dc52d792b5a01506781dbcf25c91daf11/"
+            "six-1.16.0-py2.py3-none-any.whl\n"
+        )
+    with open(tmp_path / "requirements-dev.in", "w") as f:
+        f.write("-c requirements.txt\n-c requirements-base.txt\n\n-e ./local_pkg\n")
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=tmp_path)
+    assert result.returncode == 0
+
+    # the URL of a direct reference is not compared with the installed version and
+    # the editable install counts as locked
+    result = subprocess.run(
+        [pipt_abs_path, "query", "--check"],
+        env=env,
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert result.returncode == 0, result.stdout.decode()
+
+    result = subprocess.run(
+        [pipt_abs_path, "query", "six"],
+        env=env,
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert result.stdout.decode().startswith("six @ https://files.pythonhosted.org/")
+
+
+@pytest.mark.parametrize("use_uv", [True, False], ids=["using uv", "using pip-tools"])
+def test_offline_simple_index_and_verification(tmp_path, use_uv, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+    offline_dir = tmp_path / "offline"
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+        "PIPT_USE_UV": "true" if use_uv else "false",
+    }
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    result = subprocess.run(
+        [pipt_abs_path, "download", "--index", str(offline_dir)], env=env, cwd=project
+    )
+    assert result.returncode == 0
+    assert "pytest/" in get_file_content(offline_dir / "simple" / "index.html")
+    (pytest_wheel,) = [
+        name for name in os.listdir(offline_dir) if name.startswith("pytest-")
+    ]
+    with open(offline_dir / pytest_wheel, "rb") as f:
+        pytest_hash = hashlib.sha256(f.read()).hexdigest()
+    assert f'href="../../{pytest_wheel}#sha256={pytest_hash}"' in get_file_content(
+        offline_dir / "simple" / "pytest" / "index.html"
+    )
+
+    result = subprocess.run(
+        [pipt_abs_path, "verify-offline", str(offline_dir)],
+        env=env,
+        cwd=project,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert "locked requirements have a matching artifact" in result.stdout.decode()
+
+    # offline sync into a fresh venv via the simple index
+    offline_env = {
+        **env,
+        "PIPT_OFFLINE_SYNC_DIR": str(offline_dir),
+        "PIPT_VERIFY_OFFLINE_SYNC_DIR": "true",
+    }
+    result = subprocess.run([pipt_abs_path, "rmvenv"], env=env, cwd=project)
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "run", "--", "python", "-c", "import pytest"],
+        env=offline_env,
+        cwd=project,
+    )
+    assert result.returncode == 0
+
+    # a corrupted artifact is detected before installing anything
+    with open(offline_dir / pytest_wheel, "wb") as f:
+        f.write(b"truncated download")
+    result = subprocess.run(
+        [pipt_abs_path, "verify-offline", str(offline_dir)],
+        env=env,
+        cwd=project,
+        capture_output=True,
+    )
+    assert result.returncode == 1
+    assert "for pytest==" in result.stderr.decode()
+
+    result = subprocess.run([pipt_abs_path, "rmvenv"], env=env, cwd=project)
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "sync"], env=offline_env, cwd=project, capture_output=True
+    )
+    assert result.returncode == 1
+    assert "Not installing anything" in result.stderr.decode()
+
+
+def test_offline_simple_index_regenerated(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+    offline_dir = tmp_path / "offline"
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=project)
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "download", "--index", str(offline_dir)], env=env, cwd=project
+    )
+    assert result.returncode == 0
+    assert "six/" not in get_file_content(offline_dir / "simple" / "index.html")
+
+    # lock change, then a download without --index into the same directory
+    result = subprocess.run([pipt_abs_path, "add", "six"], env=env, cwd=project)
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "download", str(offline_dir)], env=env, cwd=project
+    )
+    assert result.returncode == 0
+    assert "six/" in get_file_content(offline_dir / "simple" / "index.html")
+
+    offline_env = {**env, "PIPT_OFFLINE_SYNC_DIR": str(offline_dir)}
+    result = subprocess.run([pipt_abs_path, "rmvenv"], env=env, cwd=project)
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "run", "--", "python", "-c", "import six"],
+        env=offline_env,
+        cwd=project,
+    )
+    assert result.returncode == 0
+
+
+def test_verify(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    env = {
+        "HOME": str(tmp_path / "user_home"),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+    os.makedirs(env["HOME"])
+    project = tmp_path / "project"
+    os.makedirs(project)
+    result = subprocess.run([pipt_abs_path, "lock"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    projects = {}
+    for name in ("ok", "outdated", "inconsistent", "missing"):
+        projects[name] = tmp_path / name
+        shutil.copytree(project, projects[name])
+    with open(projects["outdated"] / "requirements.in", "a") as f:
+        f.write("requests\n")
+    with open(projects["inconsistent"] / "requirements.txt", "a") as f:
+        f.write("requests==2.0.0\n")
+    os.remove(projects["missing"] / "requirements-dev.txt")
+
+    # no venv, no Python interpreter
+    verify_env = {"HOME": str(tmp_path / "other_home"), "PATH": os.environ["PATH"]}
+    os.makedirs(verify_env["HOME"])
+    expected_exit_codes = {"ok": 0, "missing": 3, "outdated": 4, "inconsistent": 5}
+    for name, exit_code in expected_exit_codes.items():
+        result = subprocess.run(
+            [pipt_abs_path, "verify"], env=verify_env, cwd=projects[name]
+        )
+        assert result.returncode == exit_code
+
+    result = subprocess.run(
+        [pipt_abs_path, "verify", "--json", *map(str, projects.values())],
+        env=verify_env,
+        capture_output=True,
+    )
+    assert result.returncode == 5
+    report = json.loads(result.stdout)
+    assert report["exit_code"] == 5
+    assert [p["status"] for p in report["projects"]] == [
+        "ok",
+        "lock_outdated",
+        "lock_inconsistent",
+        "missing_files",
+    ]
+    assert report["projects"][2]["hashes"]["PYTHON_ENVIRONMENT_BASE_HASH"]["match"]
+    assert report["projects"][3]["missing_files"] == ["requirements-dev.txt"]
+    assert not os.path.exists(os.path.join(verify_env["HOME"], ".pipt/venvs"))
+
+
+def test_targeted_upgrade(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    env = {
+        "HOME": str(tmp_path / "user_home"),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+    os.makedirs(env["HOME"])
+
+    def locked_versions():
+        versions = {}
+        for file_name in ("requirements.txt", "requirements-dev.txt"):
+            for line in get_file_content(tmp_path / file_name).splitlines():
+                if "==" in line:
+                    name, version = line.split(" ")[0].split("==")
+                    versions[name] = version
+        return versions
+
+    # lock old versions, then relax the specifications: the pins are kept
+    with open(tmp_path / "requirements.in", "w") as f:
+        f.write("idna<3.7\nsix<1.16\n")
+    result = subprocess.run([pipt_abs_path, "lock"], env=env, cwd=tmp_path)
+    assert result.returncode == 0
+    with open(tmp_path / "requirements.in", "w") as f:
+        f.write("idna\nsix\n")
+    result = subprocess.run([pipt_abs_path, "lock"], env=env, cwd=tmp_path)
+    assert result.returncode == 0
+    before = locked_versions()
+    assert before["idna"].startswith("3.6")
+    assert before["six"] == "1.15.0"
+    locks_env = get_file_content(tmp_path / "pipt_locks.env")
+
+    result = subprocess.run(
+        [pipt_abs_path, "upgrade", "IDNA"], env=env, cwd=tmp_path, capture_output=True
+    )
+    assert result.returncode == 0
+    assert "upgrading IDNA" in result.stdout.decode()
+    after = locked_versions()
+    assert after["idna"] != before["idna"]
+    assert after["six"] == "1.15.0"
+    assert get_file_content(tmp_path / "pipt_locks.env") != locks_env
+
+    result = subprocess.run(
+        [pipt_abs_path, "sync"], env=env, cwd=tmp_path, capture_output=True
+    )
+    assert result.returncode == 0
+    assert "WARNING" not in result.stdout.decode()
+
+    # global options are accepted, other options are not
+    result = subprocess.run(
+        [pipt_abs_path, "upgrade", "--silent", "idna"], env=env, cwd=tmp_path
+    )
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "upgrade", "--no-such-option"], env=env, cwd=tmp_path
+    )
+    assert result.returncode == 1
+
+    result = subprocess.run(
+        [pipt_abs_path, "upgrade", "not-locked-package"], env=env, cwd=tmp_path
+    )
+    assert result.returncode == 1
+
+
+def test_compile_cache(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    env = {
+        "HOME": str(tmp_path / "user_home"),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+    os.makedirs(env["HOME"])
+
+    def lock():
+        result = subprocess.run(
+            [pipt_abs_path, "lock"], env=env, cwd=tmp_path, capture_output=True
+        )
+        assert result.returncode == 0
+        return result.stdout.decode()
+
+    with open(tmp_path / "requirements.in", "w") as f:
+        f.write("six\n")
+    assert "Using cached lock file" not in lock()
+    locked = get_file_content(tmp_path / "requirements.txt")
+
+    # another set of requirements (e.g. on another git branch) ...
+    with open(tmp_path / "requirements.in", "w") as f:
+        f.write("six\nidna\n")
+    assert "Using cached lock file" not in lock()
+    assert "idna==" in get_file_content(tmp_path / "requirements.txt")
+
+    # ... and back again: the resolver does not run
+    with open(tmp_path / "requirements.in", "w") as f:
+        f.write("# back again\nsix\n")
+    output = lock()
+    assert "Using cached lock file of the same runtime inputs" in output
+    assert get_file_content(tmp_path / "requirements.txt") == locked
+    assert len(os.listdir(tmp_path / "user_home" / ".pipt" / "compile_cache")) >= 2
+
+    # upgrading always asks the index
+    result = subprocess.run(
+        [pipt_abs_path, "upgrade"], env=env, cwd=tmp_path, capture_output=True
+    )
+    assert result.returncode == 0
+    assert "Using cached lock file" not in result.stdout.decode()
+
+    # and the cache can be disabled
+    with open(tmp_path / "requirements.in", "w") as f:
+        f.write("six\nidna\n")
+    env["PIPT_COMPILE_CACHE"] = "false"
+    assert "Using cached lock file" not in lock()
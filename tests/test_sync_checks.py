@@ -1,6 +1,11 @@
+import glob
 import os
+import re
+import shutil
 import subprocess
+import time
 import pytest
+from . import get_file_content
 
 
 @pytest.mark.parametrize("use_uv", [True, False], ids=["using uv", "using pip-tools"])
@@ -96,3 +101,772 @@ def test_sync_freeze_check(tmp_path, use_uv, python_interpreter):
         "Existing virtual environment is still in sync. Not syncing again"
         in result_stdout
     )
+
+
+def test_installed_fingerprint_cache(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    def sync():
+        # without sync stamp, i.e. the installed distributions are checked
+        stamp = os.path.join(path_to_venv, "sync_stamp.txt")
+        if os.path.exists(stamp):
+            os.remove(stamp)
+        result = subprocess.run(
+            [pipt_abs_path, "sync"], env=env, cwd=project, capture_output=True
+        )
+        assert result.returncode == 0
+        return result.stdout.decode()
+
+    def cache_entries():
+        entries = {}
+        for line in get_file_content(cache_file).splitlines():
+            metadata_dir, mtime, entry = line.split("\t")
+            entries[metadata_dir] = (mtime, entry)
+        return entries
+
+    def write_cache_entries(entries):
+        # replace instead of writing in place, generations share files via hardlinks
+        with open(f"{cache_file}.new", "w") as f:
+            for metadata_dir, (mtime, entry) in entries.items():
+                f.write(f"{metadata_dir}\t{mtime}\t{entry}\n")
+        os.replace(f"{cache_file}.new", cache_file)
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=project)
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--venv"], env=env, cwd=project, capture_output=True
+    )
+    path_to_venv = result.stdout.decode().splitlines()[0]
+
+    # one cache file per site-packages directory, one entry per distribution
+    (site_packages,) = glob.glob(
+        os.path.join(path_to_venv, "lib/python*/site-packages")
+    )
+    python_dir = os.path.basename(os.path.dirname(site_packages))
+    cache_file = os.path.join(
+        path_to_venv, f"installed_fingerprint_cache_{python_dir}.txt"
+    )
+    assert not os.path.exists(
+        os.path.join(path_to_venv, "installed_fingerprint_cache.txt")
+    )
+    entries = cache_entries()
+    assert set(entries) == {
+        name for name in os.listdir(site_packages) if name.endswith(".dist-info")
+    }
+    (pytest_dir,) = [name for name in entries if name.startswith("pytest-")]
+    assert entries[pytest_dir][1].split(" ")[1] in ("pip", "uv")
+
+    # unchanged venv: still in sync, entries are reused and not read again
+    assert "Not syncing again" in sync()
+    assert cache_entries() == entries
+    write_cache_entries({**entries, pytest_dir: (entries[pytest_dir][0], "tampered")})
+    assert "Syncing virtual environment with" in sync()
+    assert cache_entries()[pytest_dir][1] == "tampered"
+
+    # a changed distribution is read again
+    site_packages = os.path.realpath(site_packages)
+    os.utime(os.path.join(site_packages, pytest_dir))
+    assert "Syncing virtual environment with" in sync()
+    assert cache_entries()[pytest_dir][1] != "tampered"
+    assert "Not syncing again" in sync()
+
+    # entries of removed distributions (the dev dependencies) are dropped
+    result = subprocess.run(
+        [pipt_abs_path, "sync", "--prod"], env=env, cwd=project, capture_output=True
+    )
+    assert result.returncode == 0
+    (site_packages,) = glob.glob(
+        os.path.join(path_to_venv, "lib/python*/site-packages")
+    )
+    entries = cache_entries()
+    assert not any(name.startswith(("pytest-", "iniconfig-")) for name in entries)
+    assert set(entries) == {
+        name for name in os.listdir(site_packages) if name.endswith(".dist-info")
+    }
+
+
+@pytest.mark.parametrize("use_uv", [True, False], ids=["using uv", "using pip-tools"])
+def test_sync_stamp_fast_path(tmp_path, use_uv, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+        "PIPT_USE_UV": "true" if use_uv else "false",
+    }
+
+    # create a synced venv
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=tmp_path)
+    assert result.returncode == 0
+
+    # Nothing changed: the stamp fast path should be taken
+    result = subprocess.run(
+        [pipt_abs_path, "run", "--", "python", "-c", "print('fast')"],
+        env=env,
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    result_stdout = result.stdout.decode()
+    assert "Sync stamp matches" in result_stdout
+    assert "fast" in result_stdout
+
+    # Touching a lock file invalidates the stamp, the full checks run again
+    os.utime(tmp_path / "requirements-dev.txt")
+
+    result = subprocess.run(
+        [pipt_abs_path, "sync"], env=env, cwd=tmp_path, capture_output=True
+    )
+    assert result.returncode == 0
+    result_stdout = result.stdout.decode()
+    assert "Sync stamp matches" not in result_stdout
+    assert (
+        "Existing virtual environment is still in sync. Not syncing again"
+        in result_stdout
+    )
+
+    # ... and the stamp is renewed
+    result = subprocess.run(
+        [pipt_abs_path, "sync"], env=env, cwd=tmp_path, capture_output=True
+    )
+    assert result.returncode == 0
+    assert "Sync stamp matches" in result.stdout.decode()
+
+
+def test_concurrent_syncs(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    # several invocations starting from scratch at the same time: only one of
+    # them creates and syncs the venv, the others wait and reuse it
+    processes = [
+        subprocess.Popen(
+            [pipt_abs_path, "sync"],
+            env=env,
+            cwd=tmp_path,
+            stdout=subprocess.PIPE,
+        )
+        for _ in range(3)
+    ]
+    outputs = [process.communicate()[0].decode() for process in processes]
+
+    assert all(process.returncode == 0 for process in processes)
+    assert (
+        len([output for output in outputs if "Creating virtual environment" in output])
+        == 1
+    )
+    assert len([output for output in outputs if "Not syncing again" in output]) == 2
+
+    # venv and lock files are intact
+    result = subprocess.run(
+        [pipt_abs_path, "run", "--", "python", "-c", "import pytest"],
+        env=env,
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert "Sync stamp matches" in result.stdout.decode()
+
+
+def test_venv_generations(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--venv"], env=env, cwd=project, capture_output=True
+    )
+    path_to_venv = result.stdout.decode().splitlines()[0]
+    generations_dir = os.path.join(
+        os.path.dirname(path_to_venv),
+        "." + os.path.basename(path_to_venv) + ".generations",
+    )
+    assert os.path.islink(path_to_venv)
+    first_generation = os.path.realpath(path_to_venv)
+    assert len(os.listdir(generations_dir)) == 1
+
+    # a failing sync (package not available offline) leaves the live venv untouched
+    with open(project / "requirements.in", "a") as f:
+        f.write("six\n")
+    result = subprocess.run([pipt_abs_path, "lock"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    os.makedirs(tmp_path / "empty")
+    result = subprocess.run(
+        [pipt_abs_path, "sync"],
+        env={**env, "PIPT_OFFLINE_SYNC_DIR": str(tmp_path / "empty")},
+        cwd=project,
+    )
+    assert result.returncode != 0
+    assert os.path.realpath(path_to_venv) == first_generation
+
+    # a successful sync happens in a new generation, the previous one is kept
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    second_generation = os.path.realpath(path_to_venv)
+    assert second_generation != first_generation
+    assert sorted(os.listdir(generations_dir)) == sorted(
+        os.path.basename(os.path.dirname(generation))
+        for generation in (first_generation, second_generation)
+    )
+
+    result = subprocess.run(
+        [os.path.join(second_generation, "bin/python"), "-c", "import six"]
+    )
+    assert result.returncode == 0
+    result = subprocess.run(
+        [os.path.join(first_generation, "bin/python"), "-c", "import six"]
+    )
+    assert result.returncode != 0
+
+    # the previous generation is not modified by syncing its hardlinked clone
+    result = subprocess.run(
+        [os.path.join(first_generation, "bin/python"), "-c", "import pytest"]
+    )
+    assert result.returncode == 0
+
+    # explicit venv paths (e.g. in the project) stay plain directories by default
+    result = subprocess.run(
+        [pipt_abs_path, "sync"],
+        env={**env, "PIPT_EXPLICIT_VENV_TARGET_PATH": "./venv"},
+        cwd=project,
+    )
+    assert result.returncode == 0
+    assert os.path.isdir(project / "venv") and not os.path.islink(project / "venv")
+    assert not os.path.exists(project / ".venv.generations")
+
+
+def test_venv_pool(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--venv"], env=env, cwd=project, capture_output=True
+    )
+    path_to_venv = result.stdout.decode().splitlines()[0]
+    dev_generation = os.path.realpath(path_to_venv)
+
+    result = subprocess.run([pipt_abs_path, "sync", "--prod"], env=env, cwd=project)
+    assert result.returncode == 0
+    prod_generation = os.path.realpath(path_to_venv)
+    assert prod_generation != dev_generation
+
+    # switching back and forth activates the pooled generations without syncing
+    for args, generation in (([], dev_generation), (["--prod"], prod_generation)):
+        result = subprocess.run(
+            [pipt_abs_path, "sync", *args],
+            env={**env, "PIPT_OFFLINE_SYNC_DIR": str(tmp_path / "missing")},
+            cwd=project,
+            capture_output=True,
+        )
+        assert result.returncode == 0
+        assert "venv pool" in result.stdout.decode()
+        assert os.path.realpath(path_to_venv) == generation
+
+    # a modified generation is not reused
+    result = subprocess.run(
+        [
+            os.path.join(dev_generation, "bin/python"),
+            "-m",
+            "pip",
+            "uninstall",
+            "-y",
+            "pytest",
+        ]
+    )
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "sync"], env=env, cwd=project, capture_output=True
+    )
+    assert result.returncode == 0
+    assert "venv pool" not in result.stdout.decode()
+    assert os.path.realpath(path_to_venv) not in (dev_generation, prod_generation)
+
+    # an invalid pool size fails clearly before syncing
+    result = subprocess.run(
+        [pipt_abs_path, "sync"],
+        env={**env, "PIPT_VENV_POOL_SIZE": "three"},
+        cwd=project,
+        capture_output=True,
+    )
+    assert result.returncode == 1
+    assert "VENV_POOL_SIZE must be an integer >= 0, got 'three'" in (
+        result.stderr.decode()
+    )
+
+
+def test_sync_system_fast_path(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    # a synced venv serves as "system" Python
+    result = subprocess.run([pipt_abs_path, "sync"], env=env, cwd=tmp_path)
+    assert result.returncode == 0
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--venv"], env=env, cwd=tmp_path, capture_output=True
+    )
+    path_to_venv = os.path.realpath(result.stdout.decode().splitlines()[0])
+    system_env = {**env, "PIPT_PYTHON_INTERPRETER": path_to_venv + "/bin/python"}
+
+    def sync_system():
+        return subprocess.run(
+            [pipt_abs_path, "sync-system"],
+            env=system_env,
+            cwd=tmp_path,
+            capture_output=True,
+        )
+
+    result = sync_system()
+    assert result.returncode == 0
+    assert "Nothing to do" not in result.stdout.decode()
+    assert os.path.isfile(
+        os.path.join(path_to_venv, ".pipt_sync_system", "frozen_hash.txt")
+    )
+
+    result = sync_system()
+    assert result.returncode == 0
+    assert "Nothing to do" in result.stdout.decode()
+    assert "install locked" not in result.stdout.decode()
+
+    # changed installed distributions are synced again
+    (site_packages,) = glob.glob(
+        os.path.join(path_to_venv, "lib/python*/site-packages")
+    )
+    (pluggy_dist_info,) = glob.glob(os.path.join(site_packages, "pluggy-*.dist-info"))
+    shutil.rmtree(pluggy_dist_info)
+
+    result = sync_system()
+    assert result.returncode == 0
+    assert "Nothing to do" not in result.stdout.decode()
+    assert glob.glob(os.path.join(site_packages, "pluggy-*.dist-info"))
+
+    result = sync_system()
+    assert result.returncode == 0
+    assert "Nothing to do" in result.stdout.decode()
+
+
+def test_pack_unpack(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run(
+        [pipt_abs_path, "pack"], env=env, cwd=project, capture_output=True
+    )
+    assert result.returncode == 0
+    archive_path = result.stdout.decode().splitlines()[-1]
+    assert os.path.dirname(archive_path) == str(new_home / ".pipt/venv_archives")
+    assert os.path.isfile(archive_path)
+
+    # another project with the same lock files (i.e. another venv path)
+    other_project = tmp_path / "other_project"
+    shutil.copytree(project, other_project)
+    offline_env = {**env, "PIPT_OFFLINE_SYNC_DIR": str(tmp_path / "missing")}
+
+    result = subprocess.run(
+        [pipt_abs_path, "unpack"], env=offline_env, cwd=other_project
+    )
+    assert result.returncode == 0
+
+    result = subprocess.run(
+        [pipt_abs_path, "run", "--", "pytest", "--version"],
+        env=offline_env,
+        cwd=other_project,
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert "Sync stamp matches" in result.stdout.decode()
+
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--venv"],
+        env=env,
+        cwd=other_project,
+        capture_output=True,
+    )
+    path_to_venv = result.stdout.decode().splitlines()[0]
+    result = subprocess.run(
+        [pipt_abs_path, "info", "--venv"], env=env, cwd=project, capture_output=True
+    )
+    packed_venv = os.path.realpath(result.stdout.decode().splitlines()[0])
+    with open(os.path.join(path_to_venv, "bin/activate")) as f:
+        activate_script = f.read()
+    assert os.path.realpath(path_to_venv) in activate_script
+    assert packed_venv not in activate_script
+
+    # a corrupted archive is deleted instead of being unpacked
+    result = subprocess.run([pipt_abs_path, "rmvenv"], env=env, cwd=other_project)
+    assert result.returncode == 0
+    with open(archive_path, "r+b") as f:
+        f.truncate(os.path.getsize(archive_path) // 2)
+    result = subprocess.run(
+        [pipt_abs_path, "unpack"], env=offline_env, cwd=other_project
+    )
+    assert result.returncode == 1
+    assert not os.path.exists(archive_path)
+
+    result = subprocess.run(
+        [pipt_abs_path, "unpack"], env=offline_env, cwd=other_project
+    )
+    assert result.returncode == 1
+
+
+def test_pack_unpack_explicit_venv_path(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run(
+        [pipt_abs_path, "pack"], env=env, cwd=project, capture_output=True
+    )
+    assert result.returncode == 0
+
+    # CI / Docker: explicit venv path without venv generations
+    other_project = tmp_path / "other_project"
+    shutil.copytree(project, other_project)
+    explicit_env = {
+        **env,
+        "PIPT_EXPLICIT_VENV_TARGET_PATH": "./venv",
+        "PIPT_VENV_GENERATIONS": "false",
+        "PIPT_OFFLINE_SYNC_DIR": str(tmp_path / "missing"),
+    }
+
+    result = subprocess.run(
+        [pipt_abs_path, "unpack"], env=explicit_env, cwd=other_project
+    )
+    assert result.returncode == 0
+
+    venv_path = other_project / "venv"
+    assert not os.path.islink(venv_path)
+    assert not glob.glob(str(other_project / "venv.unpack-*"))
+
+    # console scripts are executable directly, i.e. their shebangs are correct
+    result = subprocess.run(
+        [str(venv_path / "bin/pytest"), "--version"], cwd=other_project
+    )
+    assert result.returncode == 0
+
+    with open(venv_path / "bin/activate") as f:
+        activate_script = f.read()
+    assert str(venv_path) in activate_script
+    assert ".unpack-" not in activate_script
+
+
+def test_gc(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    venvs_dir = new_home / ".pipt/venvs"
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    venvs = {}
+    for project_name in ("old", "removed", "recent"):
+        project = tmp_path / project_name
+        os.makedirs(project)
+        result = subprocess.run([pipt_abs_path, "venv"], env=env, cwd=project)
+        assert result.returncode == 0
+        result = subprocess.run(
+            [pipt_abs_path, "info", "--venv"],
+            env=env,
+            cwd=project,
+            capture_output=True,
+        )
+        venvs[project_name] = result.stdout.decode().splitlines()[0]
+        time.sleep(1.1)  # distinct last usage times
+    shutil.rmtree(tmp_path / "removed")
+
+    # venv without generations dir and usage record (e.g. of an older pipt)
+    os.makedirs(venvs_dir / "ci-venv" / "bin")
+    an_hour_ago = time.time() - 3600
+    os.utime(venvs_dir / "ci-venv", (an_hour_ago, an_hour_ago))
+
+    result = subprocess.run(
+        [pipt_abs_path, "gc", "--dry-run"], env=env, capture_output=True
+    )
+    assert result.returncode == 0
+    assert "does not exist anymore" in result.stdout.decode()
+    assert re.search(r"--> ci-venv \(\d+ MB, .*\): kept", result.stdout.decode())
+    assert all(os.path.exists(venv) for venv in venvs.values())
+
+    result = subprocess.run([pipt_abs_path, "gc"], env=env, capture_output=True)
+    assert result.returncode == 0
+    assert not os.path.exists(venvs["removed"])
+    assert not glob.glob(str(venvs_dir / ".removed-*"))
+    assert os.path.exists(venvs["old"])
+    assert os.path.exists(venvs["recent"])
+
+    # the least recently used venvs exceeding the disk budget are deleted
+    result = subprocess.run(
+        [pipt_abs_path, "gc"],
+        env={**env, "PIPT_VENV_DISK_BUDGET_MB": "1"},
+        capture_output=True,
+    )
+    assert result.returncode == 0
+    assert "exceeds disk budget" in result.stdout.decode()
+    assert not os.path.exists(venvs["old"])
+    assert os.path.exists(venvs["recent"])
+
+    # opportunistic gc at the end of an invocation, rate-limited
+    shutil.rmtree(tmp_path / "recent")
+    gc_env = {**env, "PIPT_VENV_GC_INTERVAL_HOURS": "1"}
+    with open(venvs_dir / ".gc_stamp", "w") as f:
+        f.write(f"{int(time.time())}\n")
+    result = subprocess.run([pipt_abs_path, "info"], env=gc_env, cwd=tmp_path)
+    assert result.returncode == 0
+    time.sleep(2)
+    assert os.path.exists(venvs["recent"])
+
+    os.remove(venvs_dir / ".gc_stamp")
+    result = subprocess.run([pipt_abs_path, "info"], env=gc_env, cwd=tmp_path)
+    assert result.returncode == 0
+    for _ in range(30):
+        if not os.path.exists(venvs["recent"]):
+            break
+        time.sleep(1)
+    assert not os.path.exists(venvs["recent"])
+
+
+def test_gc_explicit_venv_names(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    # venv name via environment variable
+    project = tmp_path / "named_by_env"
+    os.makedirs(project)
+    result = subprocess.run(
+        [pipt_abs_path, "venv"],
+        env={**env, "PIPT_EXPLICIT_VENV_IN_HOME_NAME": "shared-venv"},
+        cwd=project,
+    )
+    assert result.returncode == 0
+
+    # venv name in pipt_config.env of the working directory, requirements in reqs/
+    project = tmp_path / "named_by_config"
+    os.makedirs(project / "reqs")
+    with open(project / "pipt_config.env", "w") as f:
+        f.write(
+            f"REQ_SOURCE_DIR={project / 'reqs'}\n"
+            "EXPLICIT_VENV_IN_HOME_NAME=configured-venv\n"
+        )
+    result = subprocess.run([pipt_abs_path, "venv"], env=env, cwd=project)
+    assert result.returncode == 0
+
+    result = subprocess.run(
+        [pipt_abs_path, "gc", "--dry-run"], env=env, capture_output=True
+    )
+    assert result.returncode == 0
+    output = result.stdout.decode()
+    assert re.search(r"--> shared-venv \(.*\): kept", output)
+    assert re.search(r"--> configured-venv \(.*\): kept", output)
+    assert "orphaned" not in output
+
+
+def test_sync_all(tmp_path, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    root = tmp_path / "monorepo"
+    projects = [root / "service_a", root / "libs" / "service_b"]
+    for project in projects:
+        os.makedirs(project)
+        with open(project / "requirements-base.in", "w") as f:
+            f.write("packaging\npip>=24\nuv\nwheel\n")
+    # requirements in a subdirectory, pipt runs next to pipt_config.env
+    service_c = root / "service_c"
+    os.makedirs(service_c / "reqs")
+    with open(service_c / "reqs" / "requirements-base.in", "w") as f:
+        f.write("packaging\npip>=24\nuv\nwheel\n")
+    with open(service_c / "pipt_config.env", "w") as f:
+        f.write(
+            f"REQ_SOURCE_DIR={service_c / 'reqs'}\nEXPLICIT_VENV_IN_HOME_NAME=service-c\n"
+        )
+    # not a project of its own
+    os.makedirs(root / ".git" / "hidden")
+    with open(root / ".git" / "hidden" / "requirements-base.in", "w") as f:
+        f.write("pip\n")
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+    }
+
+    result = subprocess.run(
+        [pipt_abs_path, "lock", "--all", str(root)], env=env, capture_output=True
+    )
+    assert result.returncode == 0
+    output = result.stdout.decode()
+    assert "3 succeeded, 0 failed" in output
+    for project in projects + [service_c / "reqs"]:
+        assert os.path.isfile(project / "pipt_locks.env")
+        assert os.path.isfile(project / "requirements-dev.txt")
+    assert not os.path.exists(service_c / "reqs" / "pipt_config.env")
+    assert not os.path.exists(root / ".git" / "hidden" / "pipt_locks.env")
+
+    result = subprocess.run(
+        [pipt_abs_path, "sync", "--all"], env=env, cwd=root, capture_output=True
+    )
+    assert result.returncode == 0
+    output = result.stdout.decode()
+    assert "ok" in output and "libs/service_b" in output
+    for project in projects:
+        result = subprocess.run(
+            [pipt_abs_path, "sync"], env=env, cwd=project, capture_output=True
+        )
+        assert result.returncode == 0
+        assert "Sync stamp matches" in result.stdout.decode()
+    assert os.path.isdir(new_home / ".pipt" / "venvs" / "service-c")
+
+    # a failing project is reported with its output, the others are synced
+    with open(projects[0] / "requirements.txt", "a") as f:
+        f.write("this-package-does-not-exist-pipt==1.0\n")
+    result = subprocess.run(
+        [pipt_abs_path, "sync", "--all", "--prod", str(root)],
+        env=env,
+        capture_output=True,
+    )
+    assert result.returncode == 1
+    assert "2 succeeded, 1 failed" in result.stdout.decode()
+    assert "failed" in result.stderr.decode()
+    assert "service_a" in result.stderr.decode()
+
+    result = subprocess.run(
+        [pipt_abs_path, "sync", "--all", str(root)],
+        env={**env, "PIPT_MULTI_PROJECT_JOBS": "0"},
+        capture_output=True,
+    )
+    assert result.returncode == 1
+    assert "MULTI_PROJECT_JOBS must be an integer >= 1, got '0'" in (
+        result.stderr.decode()
+    )
+
+
+@pytest.mark.parametrize("use_uv", [True, False], ids=["using uv", "using pip-tools"])
+def test_pipelined_sync(tmp_path, use_uv, python_interpreter):
+    pipt_abs_path = os.path.abspath("../pipt")
+
+    new_home = tmp_path / "user_home"
+    os.makedirs(new_home)
+    project = tmp_path / "project"
+    os.makedirs(project)
+
+    env = {
+        "HOME": str(new_home),
+        "PIPT_PYTHON_INTERPRETER": python_interpreter,
+        "PIPT_USE_UV": "true" if use_uv else "false",
+    }
+
+    # no lock files: the runtime tier is installed while the dev tier is compiled
+    with open(project / "requirements.in", "w") as f:
+        f.write("-c requirements-base.txt\nsix\n")
+    result = subprocess.run(
+        [pipt_abs_path, "sync"], env=env, cwd=project, capture_output=True
+    )
+    assert result.returncode == 0, result.stderr.decode()
+    output = result.stdout.decode()
+    assert "Installing runtime dependencies while compiling dev dependencies" in output
+    assert output.index("Installing runtime dependencies") < output.index(
+        "Compiling dev dependencies"
+    )
+    assert "failed" not in output
+
+    result = subprocess.run(
+        [pipt_abs_path, "run", "--", "python", "-c", "import six, pytest"],
+        env=env,
+        cwd=project,
+    )
+    assert result.returncode == 0
+
+    result = subprocess.run(
+        [pipt_abs_path, "sync"], env=env, cwd=project, capture_output=True
+    )
+    assert result.returncode == 0
+    assert "Not syncing again" in result.stdout.decode()
+
+    # disabled
+    for file_name in glob.glob(str(project / "requirements*.txt")):
+        os.remove(file_name)
+    env["PIPT_PIPELINED_SYNC"] = "false"
+    result = subprocess.run(
+        [pipt_abs_path, "sync"], env=env, cwd=project, capture_output=True
+    )
+    assert result.returncode == 0
+    assert "Installing runtime dependencies" not in result.stdout.decode()